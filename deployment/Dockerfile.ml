@@ -26,5 +26,9 @@ EXPOSE 5001
 HEALTHCHECK --interval=30s --timeout=10s --start-period=30s --retries=3 \
   CMD curl -f http://localhost:5001/ || exit 1
 
-# Start application
-CMD ["python", "api.py"]
+# Start application under Gunicorn. No --preload: each worker must import
+# and initialize its own models, since batcher threads and TF/ONNX Runtime
+# thread pools created before fork() would not survive into the workers.
+# First boot on an empty models volume trains both models at import time,
+# so the worker timeout must cover minutes of CPU training
+CMD ["gunicorn", "--workers", "5", "--worker-class", "gthread", "--threads", "2", "--timeout", "900", "--bind", "0.0.0.0:5001", "api:app"]
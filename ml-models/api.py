@@ -1,15 +1,36 @@
+import os
+
+# Keep BLAS/OpenMP pools single-threaded per worker so Gunicorn workers
+# don't oversubscribe the CPU
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+
 from flask import Flask, request, jsonify, render_template
 from flask_cors import CORS
 import numpy as np
 import pandas as pd
-import os
 import sys
+import fcntl
+import hashlib
+import operator
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
 import json
 
 # Add the models directory to the path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+try:
+    # Inputs are validated at the API boundary, so skip sklearn's per-call
+    # finiteness checks on the hot path
+    from sklearn import set_config
+    set_config(assume_finite=True, working_memory=1024)
+except ImportError:
+    pass
+
 try:
     from random_forest_model import SolarRandomForestModel
     from lstm_model import SolarLSTMModel
@@ -24,37 +45,230 @@ CORS(app)
 # Initialize models
 rf_model = None
 lstm_model = None
+rf_batcher = None
+lstm_batcher = None
+lstm_multi_batcher = None
+lstm_getter = None
+
+class BatchPredictor:
+    """Micro-batches concurrent prediction requests into single model calls.
+
+    Request handlers enqueue a feature array and block on a future; a
+    background thread drains the queue (up to max_batch_size items or
+    max_wait seconds), runs one batched predict and dispatches results.
+    This amortizes the fixed per-call model overhead across concurrent
+    requests.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=64, max_wait=0.005):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._serve_loop, daemon=True)
+        self.worker.start()
+
+    def predict(self, features):
+        """Enqueue one sample and wait for its prediction"""
+        future = Future()
+        self.queue.put((features, future))
+        # The timeout surfaces a dead consumer thread as an error instead
+        # of hanging the request until the worker is killed
+        return future.result(timeout=30)
+
+    def _serve_loop(self):
+        while True:
+            batch = [self.queue.get()]
+
+            # Gather more requests until the batch fills or the wait expires
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Everything including batch assembly stays inside the try: a
+            # malformed item must fail its own futures, not kill the loop
+            try:
+                inputs = np.stack([features for features, _ in batch])
+                predictions = self.predict_fn(inputs)
+                for i, (_, future) in enumerate(batch):
+                    future.set_result(predictions[i])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+class MultiStepBatcher:
+    """Buckets concurrent multi-step requests by similar step counts.
+
+    Queued requests are sorted by their requested steps and grouped so
+    that step counts within a bucket differ by at most one; the bucket
+    shares a single batched rollout to the bucket maximum and each
+    request keeps only its own first `steps` outputs, so lanes waste at
+    most one timestep.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=64, max_wait=0.005):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._serve_loop, daemon=True)
+        self.worker.start()
+
+    def predict(self, sequence, steps):
+        """Enqueue one multi-step request and wait for its predictions"""
+        future = Future()
+        self.queue.put((sequence, steps, future))
+        # See BatchPredictor.predict: fail loudly if the consumer is gone
+        return future.result(timeout=30)
+
+    def _serve_loop(self):
+        while True:
+            batch = [self.queue.get()]
+
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Form buckets of requests whose step counts differ by <= 1
+            batch.sort(key=lambda item: item[1])
+            index = 0
+            while index < len(batch):
+                bucket = [batch[index]]
+                index += 1
+                while (index < len(batch) and
+                       batch[index][1] - bucket[0][1] <= 1):
+                    bucket.append(batch[index])
+                    index += 1
+
+                # Assemble inside the try so a malformed sequence fails its
+                # own bucket without killing the consumer thread
+                try:
+                    sequences = np.stack([seq for seq, _, _ in bucket])
+                    bucket_steps = bucket[-1][1]
+                    predictions = self.predict_fn(sequences, bucket_steps)
+                    for i, (_, steps, future) in enumerate(bucket):
+                        future.set_result(
+                            [float(p) for p in predictions[i][:steps]]
+                        )
+                except Exception as e:
+                    for _, _, future in bucket:
+                        if not future.done():
+                            future.set_exception(e)
+
+class PredictionCache:
+    """Bounded LRU cache with TTL for repeated prediction requests.
+
+    Dashboard polling tends to resend near-identical weather features;
+    quantized keys turn those repeats into dict lookups instead of full
+    model inference.
+    """
+
+    def __init__(self, maxsize=4096, ttl_seconds=300):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value or None if missing/expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if time.monotonic() > expires_at:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used on overflow"""
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached predictions (e.g. after a retrain)"""
+        with self.lock:
+            self.entries.clear()
+
+rf_cache = PredictionCache()
+lstm_cache = PredictionCache()
+
+# Runs the two ensemble members concurrently; sklearn and TF release the
+# GIL during inference so both actually parallelize
+ensemble_pool = ThreadPoolExecutor(max_workers=2)
 
 def initialize_models():
     """Initialize and load trained models"""
-    global rf_model, lstm_model
-    
+    global rf_model, lstm_model, rf_batcher, lstm_batcher, lstm_multi_batcher, lstm_getter
+
     try:
-        # Initialize Random Forest model
-        if SolarRandomForestModel:
-            rf_model = SolarRandomForestModel()
-            if os.path.exists('models/random_forest_solar.joblib'):
-                rf_model.load_model()
-            else:
-                print("Training Random Forest model...")
-                rf_model.train()
-                rf_model.save_model()
-        
-        # Initialize LSTM model
-        if SolarLSTMModel:
-            lstm_model = SolarLSTMModel()
-            if os.path.exists('models/lstm_solar.h5'):
-                lstm_model.load_model()
-            else:
-                print("Training LSTM model...")
-                lstm_model.train(epochs=10)  # Reduced for faster startup
-                lstm_model.save_model()
-                
+        # Workers share the models volume, so hold a file lock across the
+        # exists/train/save sequence: exactly one process trains on first
+        # boot while the others block here and then load the finished files
+        with open('models/.init.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Initialize Random Forest model
+                if SolarRandomForestModel:
+                    rf_model = SolarRandomForestModel()
+                    if os.path.exists('models/random_forest_solar.joblib'):
+                        rf_model.load_model()
+                    else:
+                        print("Training Random Forest model...")
+                        rf_model.train()
+                        rf_model.save_model()
+
+                # Initialize LSTM model
+                if SolarLSTMModel:
+                    lstm_model = SolarLSTMModel()
+                    if os.path.exists('models/lstm_solar.h5'):
+                        lstm_model.load_model()
+                    else:
+                        print("Training LSTM model...")
+                        lstm_model.train(epochs=10)  # Reduced for faster startup
+                        lstm_model.save_model()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        # Batch concurrent requests into single model calls
+        if rf_model and rf_model.is_trained:
+            rf_batcher = BatchPredictor(rf_model.predict)
+        if lstm_model and lstm_model.is_trained:
+            lstm_batcher = BatchPredictor(lstm_model.predict_batch)
+            lstm_multi_batcher = MultiStepBatcher(lstm_model.predict_multi_step_batch)
+            lstm_getter = operator.itemgetter(*lstm_model.feature_names)
+
         print("Models initialized successfully!")
-        
+
     except Exception as e:
         print(f"Model initialization error: {e}")
 
+# Load models once per process at import time. Each Gunicorn worker runs
+# this on its own import (no --preload): batcher threads and TF/ONNX
+# Runtime thread pools would not survive a fork from the master
+if not app.config.get('MODELS_LOADED'):
+    os.makedirs('models', exist_ok=True)
+    initialize_models()
+    app.config['MODELS_LOADED'] = True
+
 @app.route('/', methods=['GET'])
 def home():
     """API home endpoint"""
@@ -95,8 +309,8 @@ def predict_random_forest():
         
         # Validate input
         required_features = rf_model.feature_names
-        missing_features = [f for f in required_features if f not in data]
-        
+        missing_features = sorted(set(required_features).difference(data))
+
         if missing_features:
             return jsonify({
                 'error': 'Missing features',
@@ -104,9 +318,22 @@ def predict_random_forest():
                 'required': required_features
             }), 400
         
-        # Make prediction
-        prediction = rf_model.predict(data)
-        
+        # Reuse recent predictions for near-identical features
+        cache_key = tuple(round(float(data[f]), 2) for f in required_features)
+        cached = rf_cache.get(cache_key)
+        if cached is not None:
+            prediction = [cached]
+        else:
+            # Make prediction through the batching queue when available
+            features = np.asarray(
+                [data[f] for f in required_features], dtype=np.float32
+            )
+            if rf_batcher:
+                prediction = [rf_batcher.predict(features)]
+            else:
+                prediction = rf_model.predict(data)
+            rf_cache.put(cache_key, float(prediction[0]))
+
         return jsonify({
             'prediction': float(prediction[0]),
             'model': 'random_forest',
@@ -138,25 +365,59 @@ def predict_lstm():
                 'error': f'Sequence must have {lstm_model.sequence_length} time steps'
             }), 400
         
-        # Convert to numpy array
-        sequence_array = np.array([[item[f] for f in lstm_model.feature_names] 
-                                  for item in sequence])
-        
-        # Make prediction
-        prediction = lstm_model.predict_sequence(sequence_array)
+        # Fill a preallocated array via a single itemgetter per row instead
+        # of a nested list comprehension with per-field dict lookups
+        sequence_array = np.empty(
+            (lstm_model.sequence_length, lstm_model.features), dtype=np.float32
+        )
+        getter = lstm_getter or operator.itemgetter(*lstm_model.feature_names)
+        for i, item in enumerate(sequence):
+            sequence_array[i] = getter(item)
         
-        # Multi-step prediction if requested
+        # Validate steps before it reaches the shared batcher thread; an
+        # unbounded rollout would stall every queued multi-step request
         steps = data.get('steps', 1)
+        if not isinstance(steps, int) or isinstance(steps, bool) or not 1 <= steps <= 168:
+            return jsonify({
+                'error': 'steps must be an integer between 1 and 168'
+            }), 400
+
+        # Reuse recent predictions for identical sequences
+        cache_key = (
+            hashlib.blake2b(sequence_array.tobytes(), digest_size=16).digest(),
+            steps
+        )
+        cached = lstm_cache.get(cache_key)
+
+        # Multi-step prediction if requested
         if steps > 1:
-            multi_predictions = lstm_model.predict_multi_step(sequence_array, steps)
+            if cached is not None:
+                multi_predictions = cached
+            else:
+                if lstm_multi_batcher:
+                    multi_predictions = lstm_multi_batcher.predict(sequence_array, steps)
+                else:
+                    multi_predictions = lstm_model.predict_multi_step(sequence_array, steps)
+                multi_predictions = [float(p) for p in multi_predictions]
+                lstm_cache.put(cache_key, multi_predictions)
             return jsonify({
-                'predictions': [float(p) for p in multi_predictions],
+                'predictions': multi_predictions,
                 'model': 'lstm',
                 'unit': 'W/m²',
                 'steps': steps,
                 'timestamp': datetime.now().isoformat()
             })
-        
+
+        if cached is not None:
+            prediction = cached
+        else:
+            # Make prediction through the batching queue when available
+            if lstm_batcher:
+                prediction = lstm_batcher.predict(sequence_array)
+            else:
+                prediction = lstm_model.predict_sequence(sequence_array)
+            lstm_cache.put(cache_key, float(prediction))
+
         return jsonify({
             'prediction': float(prediction),
             'model': 'lstm',
@@ -176,14 +437,16 @@ def predict_combined():
     try:
         data = request.get_json()
         
-        # Get Random Forest prediction
-        rf_prediction = rf_model.predict(data)[0]
-        
         # For LSTM, we need a sequence - use current data point repeated
         # (In practice, you'd have historical sequence)
         current_point = [data[f] for f in lstm_model.feature_names]
         mock_sequence = np.array([current_point] * lstm_model.sequence_length)
-        lstm_prediction = lstm_model.predict_sequence(mock_sequence)
+
+        # The two models share no data dependency, so run them concurrently
+        rf_future = ensemble_pool.submit(rf_model.predict, data)
+        lstm_future = ensemble_pool.submit(lstm_model.predict_sequence, mock_sequence)
+        rf_prediction = rf_future.result()[0]
+        lstm_prediction = lstm_future.result()
         
         # Ensemble prediction (weighted average)
         rf_weight = 0.6
@@ -221,8 +484,9 @@ def retrain_models():
         if retrain_type in ['random_forest', 'both']:
             if rf_model:
                 print("Retraining Random Forest model...")
-                rf_results = rf_model.train()
+                rf_results = rf_model.train(incremental=True)
                 rf_model.save_model()
+                rf_cache.clear()  # cached predictions are from the old model
                 results['random_forest'] = rf_results
         
         if retrain_type in ['lstm', 'both']:
@@ -230,6 +494,7 @@ def retrain_models():
                 print("Retraining LSTM model...")
                 lstm_results = lstm_model.train(epochs=10)
                 lstm_model.save_model()
+                lstm_cache.clear()  # cached predictions are from the old model
                 results['lstm'] = {
                     'val_loss': lstm_results['val_loss'],
                     'val_mae': lstm_results['val_mae']
@@ -279,12 +544,7 @@ def generate_sample_data():
 
 if __name__ == '__main__':
     print("Starting Solar Mapping ML API...")
-    
-    # Create models directory
-    os.makedirs('models', exist_ok=True)
-    
-    # Initialize models
-    initialize_models()
-    
-    # Start Flask app
-    app.run(host='0.0.0.0', port=5001, debug=True)
+
+    # Start Flask dev server (production uses Gunicorn, see Dockerfile.ml)
+    debug_mode = os.environ.get('FLASK_ENV') == 'development'
+    app.run(host='0.0.0.0', port=5001, debug=debug_mode)
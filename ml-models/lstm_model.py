@@ -1,18 +1,40 @@
+import os
+
+# Let TF pick the oneDNN-fused LSTM kernels on CPU
+os.environ.setdefault('TF_ENABLE_ONEDNN_OPTS', '1')
+
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import pandas as pd
 import tensorflow as tf
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.metrics import mean_squared_error, r2_score
 import joblib
-import os
 from datetime import datetime, timedelta
 import json
 
+try:
+    import tf2onnx
+    import onnxruntime as ort
+except ImportError:
+    tf2onnx = None
+    ort = None
+
 class SolarLSTMModel:
     def __init__(self, sequence_length=24, features=10):
         self.sequence_length = sequence_length  # Hours of historical data
         self.features = features
         self.model = None
+        self.session = None
+        self.session_b1 = None
+        self.interpreter = None
+        self._rollout = None
+        self._batch_rollout = None
+        self._infer = None
+        self._x_scale = None
+        self._x_min = None
+        self._y_scale = None
+        self._y_min = None
         self.scaler_X = MinMaxScaler()
         self.scaler_y = MinMaxScaler()
         self.is_trained = False
@@ -25,20 +47,22 @@ class SolarLSTMModel:
     
     def create_model(self):
         """Create LSTM model architecture"""
+        # Keep LSTM args at the defaults (activations, no recurrent_dropout,
+        # unroll=False) so the fused cuDNN/oneDNN kernel path applies
         model = tf.keras.Sequential([
             tf.keras.layers.LSTM(
-                50, 
-                return_sequences=True, 
+                50,
+                return_sequences=True,
+                unroll=False,
                 input_shape=(self.sequence_length, self.features)
             ),
             tf.keras.layers.Dropout(0.2),
-            
-            tf.keras.layers.LSTM(50, return_sequences=True),
-            tf.keras.layers.Dropout(0.2),
-            
-            tf.keras.layers.LSTM(25),
+
+            tf.keras.layers.LSTM(50, unroll=False),
             tf.keras.layers.Dropout(0.2),
-            
+
+            # Dense over the last hidden state replaces a third recurrent
+            # pass and skips one full sequence traversal
             tf.keras.layers.Dense(25, activation='relu'),
             tf.keras.layers.Dense(1)
         ])
@@ -53,70 +77,73 @@ class SolarLSTMModel:
     
     def generate_time_series_data(self, n_days=365):
         """Generate synthetic time series data"""
-        np.random.seed(42)
-        
+        rng = np.random.default_rng(42)
+
         # Generate hourly data for n_days
-        hours = n_days * 24
-        
+        n_hours = n_days * 24
+
         # Time features
         time_series = pd.date_range(
-            start='2023-01-01', 
-            periods=hours, 
+            start='2023-01-01',
+            periods=n_hours,
             freq='H'
         )
-        
-        data = []
-        for i, timestamp in enumerate(time_series):
-            hour = timestamp.hour
-            day_of_year = timestamp.dayofyear
-            
-            # Simulate weather patterns with some seasonal variation
-            base_temp = 25 + 10 * np.sin(2 * np.pi * day_of_year / 365)
-            temperature = base_temp + 5 * np.sin(2 * np.pi * hour / 24) + np.random.normal(0, 2)
-            
-            humidity = 50 + 30 * np.sin(2 * np.pi * day_of_year / 365) + np.random.normal(0, 10)
-            humidity = np.clip(humidity, 20, 90)
-            
-            pressure = 1013 + np.random.normal(0, 10)
-            wind_speed = np.abs(np.random.normal(3, 2))
-            
-            cloud_cover = 30 + 40 * np.sin(2 * np.pi * day_of_year / 365) + np.random.normal(0, 20)
-            cloud_cover = np.clip(cloud_cover, 0, 100)
-            
-            uv_index = max(0, 8 * np.sin(np.pi * hour / 24) + np.random.normal(0, 1))
-            
-            # Indian coordinates (example: Delhi region)
-            latitude = 28.6139 + np.random.normal(0, 0.1)
-            longitude = 77.2090 + np.random.normal(0, 0.1)
-            
-            # Calculate solar irradiance
-            if 6 <= hour <= 18:  # Daylight hours
-                base_irradiance = 1000 * np.sin(np.pi * (hour - 6) / 12)
-                cloud_reduction = (100 - cloud_cover) / 100
-                seasonal_factor = 0.7 + 0.6 * np.sin(2 * np.pi * day_of_year / 365)
-                irradiance = base_irradiance * cloud_reduction * seasonal_factor
-                irradiance += np.random.normal(0, 50)  # Add noise
-            else:
-                irradiance = 0
-            
-            irradiance = max(0, irradiance)
-            
-            data.append({
-                'timestamp': timestamp,
-                'temperature': temperature,
-                'humidity': humidity,
-                'pressure': pressure,
-                'wind_speed': wind_speed,
-                'cloud_cover': cloud_cover,
-                'uv_index': uv_index,
-                'hour': hour,
-                'day_of_year': day_of_year,
-                'latitude': latitude,
-                'longitude': longitude,
-                'solar_irradiance': irradiance
-            })
-        
-        return pd.DataFrame(data)
+        hour = time_series.hour.values
+        day_of_year = time_series.dayofyear.values
+
+        # Simulate weather patterns with some seasonal variation
+        seasonal_wave = np.sin(2 * np.pi * day_of_year / 365)
+        temperature = (25 + 10 * seasonal_wave +
+                      5 * np.sin(2 * np.pi * hour / 24) +
+                      rng.normal(0, 2, n_hours))
+
+        humidity = 50 + 30 * seasonal_wave + rng.normal(0, 10, n_hours)
+        humidity = np.clip(humidity, 20, 90)
+
+        pressure = 1013 + rng.normal(0, 10, n_hours)
+        wind_speed = np.abs(rng.normal(3, 2, n_hours))
+
+        cloud_cover = 30 + 40 * seasonal_wave + rng.normal(0, 20, n_hours)
+        cloud_cover = np.clip(cloud_cover, 0, 100)
+
+        uv_index = np.maximum(
+            0, 8 * np.sin(np.pi * hour / 24) + rng.normal(0, 1, n_hours)
+        )
+
+        # Indian coordinates (example: Delhi region)
+        latitude = 28.6139 + rng.normal(0, 0.1, n_hours)
+        longitude = 77.2090 + rng.normal(0, 0.1, n_hours)
+
+        # Calculate solar irradiance for daylight hours (6-18)
+        base_irradiance = 1000 * np.sin(np.pi * (hour - 6) / 12)
+        cloud_reduction = (100 - cloud_cover) / 100
+        seasonal_factor = 0.7 + 0.6 * seasonal_wave
+        irradiance = np.where(
+            (hour >= 6) & (hour <= 18),
+            base_irradiance * cloud_reduction * seasonal_factor +
+            rng.normal(0, 50, n_hours),  # Add noise
+            0.0
+        )
+
+        irradiance = np.maximum(irradiance, 0)
+
+        # Hand pandas pre-typed float32 columns so construction neither
+        # re-infers dtypes nor copies; downstream .values reuse the buffers
+        cols = {
+            'timestamp': time_series,
+            'temperature': temperature.astype(np.float32, copy=False),
+            'humidity': humidity.astype(np.float32, copy=False),
+            'pressure': pressure.astype(np.float32, copy=False),
+            'wind_speed': wind_speed.astype(np.float32, copy=False),
+            'cloud_cover': cloud_cover.astype(np.float32, copy=False),
+            'uv_index': uv_index.astype(np.float32, copy=False),
+            'hour': hour.astype(np.float32, copy=False),
+            'day_of_year': day_of_year.astype(np.float32, copy=False),
+            'latitude': latitude.astype(np.float32, copy=False),
+            'longitude': longitude.astype(np.float32, copy=False),
+            'solar_irradiance': irradiance.astype(np.float32, copy=False)
+        }
+        return pd.DataFrame(cols, copy=False)
     
     def prepare_sequences(self, data, target_col='solar_irradiance'):
         """Prepare sequences for LSTM training"""
@@ -126,14 +153,16 @@ class SolarLSTMModel:
         
         scaled_features = self.scaler_X.fit_transform(feature_data)
         scaled_target = self.scaler_y.fit_transform(target_data)
-        
-        # Create sequences
-        X, y = [], []
-        for i in range(self.sequence_length, len(scaled_features)):
-            X.append(scaled_features[i-self.sequence_length:i])
-            y.append(scaled_target[i])
-        
-        return np.array(X), np.array(y)
+
+        # Create sequences as a zero-copy strided view over the scaled data
+        windows = sliding_window_view(
+            scaled_features, (self.sequence_length, self.features)
+        )
+        X = windows[:-1, 0]  # shape (N - seq, seq, features)
+        y = scaled_target[self.sequence_length:]
+
+        # Keras needs contiguous memory; copy once here instead of per-window
+        return np.ascontiguousarray(X), y
     
     def train(self, data=None, epochs=50, batch_size=32, validation_split=0.2):
         """Train the LSTM model"""
@@ -144,9 +173,14 @@ class SolarLSTMModel:
         # Prepare sequences
         print("Preparing sequences...")
         X, y = self.prepare_sequences(data)
+        self._materialize_scaler_params()
         
-        # Create model
+        # Create model; traced functions capture the old model's variables,
+        # so they must be rebuilt against the new one
         self.model = self.create_model()
+        self._rollout = None
+        self._batch_rollout = None
+        self._infer = None
         
         # Callbacks
         early_stopping = tf.keras.callbacks.EarlyStopping(
@@ -189,6 +223,140 @@ class SolarLSTMModel:
             'val_mae': val_mae
         }
     
+    def _materialize_scaler_params(self):
+        """Cache fitted scaler parameters as raw float32 arrays"""
+        self._x_scale = self.scaler_X.scale_.astype(np.float32)
+        self._x_min = self.scaler_X.min_.astype(np.float32)
+        self._y_scale = self.scaler_y.scale_.astype(np.float32)
+        self._y_min = self.scaler_y.min_.astype(np.float32)
+
+    def _scale_input(self, sequences):
+        """Scale features inline, skipping sklearn's per-call dispatch"""
+        if self._x_scale is None:
+            self._materialize_scaler_params()
+        return sequences * self._x_scale + self._x_min
+
+    def _unscale_output(self, scaled_predictions):
+        """Invert the target scaling inline"""
+        if self._y_scale is None:
+            self._materialize_scaler_params()
+        return (scaled_predictions - self._y_min) / self._y_scale
+
+    def export_onnx(self, filepath='models/lstm_solar.onnx'):
+        """Export the trained network to ONNX for low-latency inference"""
+        if tf2onnx is None or ort is None:
+            print("tf2onnx/onnxruntime not available, using Keras for inference")
+            return
+
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+        spec = [tf.TensorSpec(
+            (None, self.sequence_length, self.features), tf.float32, name='input'
+        )]
+        tf2onnx.convert.from_keras(
+            self.model, input_signature=spec, opset=17, output_path=filepath
+        )
+
+        # Also export a copy specialized to batch size 1, the common case
+        # for interactive requests; static shapes let the runtime pre-plan
+        # allocations and pick fixed-tile kernels
+        b1_path = filepath.replace('.onnx', '_b1.onnx')
+        spec_b1 = [tf.TensorSpec(
+            (1, self.sequence_length, self.features), tf.float32, name='input'
+        )]
+        tf2onnx.convert.from_keras(
+            self.model, input_signature=spec_b1, opset=17, output_path=b1_path
+        )
+
+        self._create_session(filepath)
+        self.session_b1 = self._create_fixed_session(b1_path)
+        print(f"ONNX model saved to {filepath}")
+
+    def _create_session(self, filepath):
+        """Build an onnxruntime session with full graph optimization"""
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = \
+            ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            filepath,
+            sess_options=sess_options,
+            providers=['CPUExecutionProvider']
+        )
+
+    def _create_fixed_session(self, filepath):
+        """Build a session for the batch-1 shape-specialized export"""
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = \
+            ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_options.intra_op_num_threads = 1
+        sess_options.add_session_config_entry('session.enable_mem_reuse', '1')
+        return ort.InferenceSession(
+            filepath,
+            sess_options=sess_options,
+            providers=['CPUExecutionProvider']
+        )
+
+    def export_tflite_int8(self, filepath='models/lstm_solar_int8.tflite'):
+        """Post-training quantize the network to int8 via TFLite"""
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+        def representative_dataset():
+            data = self.generate_time_series_data(n_days=30)
+            scaled = self.scaler_X.transform(
+                data[self.feature_names].values.astype(np.float32)
+            )
+            windows = sliding_window_view(
+                scaled, (self.sequence_length, self.features)
+            )[:-1, 0]
+            for i in range(min(len(windows), 200)):
+                yield [np.ascontiguousarray(windows[i:i+1], dtype=np.float32)]
+
+        converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        # Keras LSTMs lower through TensorList ops; allow select TF ops and
+        # keep the lists unlowered or the conversion fails
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS,
+            tf.lite.OpsSet.SELECT_TF_OPS
+        ]
+        converter._experimental_lower_tensor_list_ops = False
+
+        with open(filepath, 'wb') as f:
+            f.write(converter.convert())
+        print(f"Quantized TFLite model saved to {filepath}")
+
+    def _run_inference(self, scaled_input):
+        """Run one forward pass on a scaled (batch, seq, features) tensor"""
+        scaled_input = np.asarray(scaled_input, dtype=np.float32)
+        if self.session is not None:
+            # Single requests hit the shape-specialized session
+            if self.session_b1 is not None and scaled_input.shape[0] == 1:
+                return self.session_b1.run(None, {'input': scaled_input})[0]
+            return self.session.run(None, {'input': scaled_input})[0]
+        if self.interpreter is not None:
+            input_details = self.interpreter.get_input_details()[0]
+            output_details = self.interpreter.get_output_details()[0]
+            if tuple(input_details['shape']) != scaled_input.shape:
+                self.interpreter.resize_tensor_input(
+                    input_details['index'], scaled_input.shape
+                )
+                self.interpreter.allocate_tensors()
+            self.interpreter.set_tensor(input_details['index'], scaled_input)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(output_details['index'])
+
+        # Keras fallback: call a concrete traced function directly instead
+        # of paying model.predict dispatch per request
+        if self._infer is None:
+            self._infer = tf.function(
+                lambda x: self.model(x, training=False),
+                input_signature=[tf.TensorSpec(
+                    (None, self.sequence_length, self.features), tf.float32
+                )]
+            ).get_concrete_function()
+        return self._infer(tf.constant(scaled_input)).numpy()
+
     def predict_sequence(self, weather_sequence):
         """Predict solar irradiance for next time step"""
         if not self.is_trained:
@@ -196,48 +364,137 @@ class SolarLSTMModel:
         
         if len(weather_sequence) != self.sequence_length:
             raise ValueError(f"Input sequence must have {self.sequence_length} time steps")
-        
-        # Prepare input
-        if isinstance(weather_sequence, list):
-            weather_sequence = np.array(weather_sequence)
-        
+
+        # Prepare input as float32 to halve memory traffic
+        weather_sequence = np.asarray(weather_sequence, dtype=np.float32)
+
         # Scale input
-        scaled_input = self.scaler_X.transform(weather_sequence)
-        
+        scaled_input = self._scale_input(weather_sequence)
+
         # Reshape for prediction
         input_tensor = scaled_input.reshape(1, self.sequence_length, self.features)
-        
+
         # Make prediction
-        scaled_prediction = self.model.predict(input_tensor, verbose=0)
-        
+        scaled_prediction = self._run_inference(input_tensor)
+
         # Inverse transform
-        prediction = self.scaler_y.inverse_transform(scaled_prediction)
-        
+        prediction = self._unscale_output(scaled_prediction)
+
         return prediction[0][0]
     
+    def predict_batch(self, sequences):
+        """Predict solar irradiance for a batch of sequences in one call"""
+        if not self.is_trained:
+            raise ValueError("Model must be trained before making predictions")
+
+        sequences = np.asarray(sequences, dtype=np.float32)
+        if sequences.ndim == 2:
+            sequences = sequences[np.newaxis]
+
+        batch_size, seq_len, _ = sequences.shape
+        if seq_len != self.sequence_length:
+            raise ValueError(f"Input sequences must have {self.sequence_length} time steps")
+
+        # Scale all sequences at once (broadcasts over the batch dimension)
+        scaled_input = self._scale_input(sequences)
+
+        # Single batched prediction
+        scaled_predictions = self._run_inference(scaled_input)
+
+        # Inverse transform
+        predictions = self._unscale_output(scaled_predictions)
+
+        return predictions.ravel()
+
+    def _build_rollout(self):
+        """Trace the autoregressive rollout as a single TF graph"""
+        @tf.function(input_signature=[
+            tf.TensorSpec((self.sequence_length, self.features), tf.float32),
+            tf.TensorSpec((), tf.int32)
+        ])
+        def rollout(sequence, steps):
+            predictions = tf.TensorArray(tf.float32, size=steps)
+            current_sequence = sequence
+            for i in tf.range(steps):
+                # Predict next step
+                next_pred = self.model(current_sequence[tf.newaxis], training=False)
+                predictions = predictions.write(i, next_pred[0, 0])
+
+                # Update sequence (this is simplified - in practice you'd need
+                # to update weather features as well)
+                current_sequence = tf.concat(
+                    [current_sequence[1:], current_sequence[-1:]], axis=0
+                )
+            return predictions.stack()
+
+        return rollout
+
     def predict_multi_step(self, initial_sequence, steps=24):
         """Predict multiple steps ahead"""
         if not self.is_trained:
             raise ValueError("Model must be trained before making predictions")
-        
-        predictions = []
-        current_sequence = initial_sequence.copy()
-        
-        for _ in range(steps):
-            # Predict next step
-            next_pred = self.predict_sequence(current_sequence)
-            predictions.append(next_pred)
-            
-            # Update sequence (this is simplified - in practice you'd need 
-            # to update weather features as well)
-            new_row = current_sequence[-1].copy()
-            # Update irradiance prediction in the weather data would require
-            # additional weather forecasting
-            current_sequence = np.vstack([current_sequence[1:], new_row])
-        
-        return predictions
+
+        # All autoregressive steps run inside one traced graph call instead
+        # of crossing the Python/TF boundary per step
+        if self._rollout is None:
+            self._rollout = self._build_rollout()
+
+        scaled_sequence = self._scale_input(
+            np.asarray(initial_sequence, dtype=np.float32)
+        )
+        scaled_predictions = self._rollout(
+            tf.constant(scaled_sequence, tf.float32),
+            tf.constant(steps, tf.int32)
+        ).numpy()
+
+        # Inverse transform all steps at once
+        predictions = self._unscale_output(scaled_predictions).ravel()
+
+        return list(predictions)
     
-    def save_model(self, model_path='models/lstm_solar.h5', 
+    def _build_batch_rollout(self):
+        """Trace the autoregressive rollout over a whole batch of sequences"""
+        @tf.function(input_signature=[
+            tf.TensorSpec((None, self.sequence_length, self.features), tf.float32),
+            tf.TensorSpec((), tf.int32)
+        ])
+        def rollout(sequences, steps):
+            predictions = tf.TensorArray(tf.float32, size=steps)
+            current_sequences = sequences
+            for i in tf.range(steps):
+                next_pred = self.model(current_sequences, training=False)
+                predictions = predictions.write(i, next_pred[:, 0])
+                current_sequences = tf.concat(
+                    [current_sequences[:, 1:], current_sequences[:, -1:]], axis=1
+                )
+            return predictions.stack()  # (steps, batch)
+
+        return rollout
+
+    def predict_multi_step_batch(self, sequences, steps=24):
+        """Predict multiple steps ahead for a batch of sequences at once"""
+        if not self.is_trained:
+            raise ValueError("Model must be trained before making predictions")
+
+        sequences = np.asarray(sequences, dtype=np.float32)
+        if sequences.ndim == 2:
+            sequences = sequences[np.newaxis]
+
+        if self._batch_rollout is None:
+            self._batch_rollout = self._build_batch_rollout()
+
+        scaled_sequences = self._scale_input(sequences)
+
+        scaled_predictions = self._batch_rollout(
+            tf.constant(scaled_sequences, tf.float32),
+            tf.constant(steps, tf.int32)
+        ).numpy()  # (steps, batch)
+
+        predictions = self._unscale_output(scaled_predictions)
+
+        return predictions.T  # (batch, steps)
+
+    def save_model(self, model_path='models/lstm_solar.h5',
                    scaler_path='models/lstm_scalers.joblib'):
         """Save trained model and scalers"""
         os.makedirs(os.path.dirname(model_path), exist_ok=True)
@@ -251,24 +508,57 @@ class SolarLSTMModel:
             'scaler_y': self.scaler_y
         }
         joblib.dump(scalers, scaler_path)
-        
+
         print(f"Model saved to {model_path}")
         print(f"Scalers saved to {scaler_path}")
+
+        # Export to ONNX for fast inference
+        self.export_onnx()
+
+        # Without ONNX Runtime, export the quantized TFLite fallback that
+        # load_model and _run_inference pick up instead
+        if self.session is None:
+            try:
+                self.export_tflite_int8()
+            except Exception as e:
+                print(f"TFLite export failed: {e}")
     
     def load_model(self, model_path='models/lstm_solar.h5',
                    scaler_path='models/lstm_scalers.joblib'):
         """Load trained model and scalers"""
         if os.path.exists(model_path) and os.path.exists(scaler_path):
-            # Load model
+            # Load model and drop any traces of a previously held model
             self.model = tf.keras.models.load_model(model_path)
+            self._rollout = None
+            self._batch_rollout = None
+            self._infer = None
             
             # Load scalers
             scalers = joblib.load(scaler_path)
             self.scaler_X = scalers['scaler_X']
             self.scaler_y = scalers['scaler_y']
-            
+            self._materialize_scaler_params()
+
             self.is_trained = True
             print(f"Model loaded from {model_path}")
+
+            # Reuse an existing ONNX export or create one from the loaded model
+            onnx_path = 'models/lstm_solar.onnx'
+            if ort is not None and os.path.exists(onnx_path):
+                self._create_session(onnx_path)
+                b1_path = 'models/lstm_solar_b1.onnx'
+                if os.path.exists(b1_path):
+                    self.session_b1 = self._create_fixed_session(b1_path)
+                print(f"ONNX model loaded from {onnx_path}")
+            else:
+                self.export_onnx(onnx_path)
+
+            # Quantized fallback when ONNX Runtime is unavailable
+            tflite_path = 'models/lstm_solar_int8.tflite'
+            if self.session is None and os.path.exists(tflite_path):
+                self.interpreter = tf.lite.Interpreter(model_path=tflite_path)
+                self.interpreter.allocate_tensors()
+                print(f"Quantized TFLite model loaded from {tflite_path}")
         else:
             print(f"Model files not found")
 
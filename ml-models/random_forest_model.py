@@ -1,28 +1,86 @@
 import numpy as np
 import pandas as pd
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
+from collections import deque
 import joblib
+import math
 import os
 from datetime import datetime, timedelta
 import json
 
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = None
+
+try:
+    import skl2onnx
+    from skl2onnx.common.data_types import FloatTensorType
+    import onnxruntime as ort
+except ImportError:
+    skl2onnx = None
+    ort = None
+
+try:
+    import treelite
+    import treelite_runtime
+except ImportError:
+    treelite = None
+    treelite_runtime = None
+
+def _compute_irradiance(temperature, cloud_cover, hour, day_of_year, noise, out):
+    """Elementwise irradiance kernel, JIT-compiled when numba is available"""
+    for i in prange(out.shape[0]):
+        # Base irradiance from the daily curve, no negative values
+        base_irradiance = 1000.0 * math.sin(math.pi * hour[i] / 24.0)
+        if base_irradiance < 0.0:
+            base_irradiance = 0.0
+
+        # Weather adjustments
+        cloud_reduction = (100.0 - cloud_cover[i]) / 100.0
+        temp_factor = 1.0 - abs(temperature[i] - 25.0) / 100.0  # Optimal at 25°C
+
+        # Seasonal adjustment
+        seasonal_factor = 0.8 + 0.4 * math.sin(2.0 * math.pi * day_of_year[i] / 365.0)
+
+        # Final irradiance with noise, ensured non-negative
+        irradiance = (base_irradiance * cloud_reduction *
+                     temp_factor * seasonal_factor * noise[i])
+        out[i] = irradiance if irradiance > 0.0 else 0.0
+
+if njit is not None:
+    _compute_irradiance = njit(parallel=True, fastmath=True, cache=True)(
+        _compute_irradiance
+    )
+else:
+    prange = range
+
 class SolarRandomForestModel:
-    def __init__(self):
+    def __init__(self, max_depth=10, max_leaf_nodes=None):
         self.model = RandomForestRegressor(
             n_estimators=100,
-            max_depth=10,
+            max_depth=max_depth,
+            max_leaf_nodes=max_leaf_nodes,
+            warm_start=True,
             random_state=42,
             n_jobs=-1
         )
+        self.session = None
+        self.predictor = None
         self.is_trained = False
+        # Rolling buffer of recent samples for incremental retraining
+        self._buffer = deque(maxlen=50000)
         self.feature_names = [
             'temperature', 'humidity', 'pressure', 'wind_speed',
             'cloud_cover', 'uv_index', 'hour', 'day_of_year',
             'latitude', 'longitude'
         ]
-    
+        self._feat_idx = {f: i for i, f in enumerate(self.feature_names)}
+
     def generate_synthetic_data(self, n_samples=10000):
         """Generate synthetic solar data for training"""
         np.random.seed(42)
@@ -43,24 +101,17 @@ class SolarRandomForestModel:
         latitude = np.random.uniform(8.4, 37.6, n_samples)   # India lat range
         longitude = np.random.uniform(68.7, 97.25, n_samples) # India lon range
         
-        # Calculate solar irradiance based on features
-        # Base irradiance calculation
-        base_irradiance = 1000 * np.sin(np.pi * hour / 24)  # Daily curve
-        base_irradiance = np.maximum(base_irradiance, 0)      # No negative values
-        
-        # Weather adjustments
-        cloud_reduction = (100 - cloud_cover) / 100
-        temp_factor = 1 - np.abs(temperature - 25) / 100     # Optimal at 25°C
-        
-        # Seasonal adjustment
-        seasonal_factor = 0.8 + 0.4 * np.sin(2 * np.pi * day_of_year / 365)
-        
-        # Calculate final irradiance
-        irradiance = (base_irradiance * cloud_reduction * 
-                     temp_factor * seasonal_factor * 
-                     np.random.normal(1, 0.1, n_samples))  # Add noise
-        
-        irradiance = np.maximum(irradiance, 0)  # Ensure non-negative
+        # Calculate solar irradiance based on features via the compiled kernel
+        noise = np.random.normal(1, 0.1, n_samples)
+        irradiance = np.empty(n_samples)
+        _compute_irradiance(
+            temperature,
+            cloud_cover,
+            hour.astype(np.float64),
+            day_of_year.astype(np.float64),
+            noise,
+            irradiance
+        )
         
         # Create DataFrame
         data = pd.DataFrame({
@@ -79,24 +130,45 @@ class SolarRandomForestModel:
         
         return data
     
-    def train(self, data=None):
-        """Train the Random Forest model"""
+    def train(self, data=None, incremental=False):
+        """Train the Random Forest model.
+
+        With incremental=True a warm-started forest grows 20 extra trees
+        on the rolling sample buffer instead of rebuilding all trees.
+        """
         if data is None:
             print("Generating synthetic training data...")
             data = self.generate_synthetic_data()
-        
-        # Prepare features and target
-        X = data[self.feature_names]
-        y = data['solar_irradiance']
-        
+
+        # Prepare features and target, keeping a rolling sample buffer
+        X = data[self.feature_names].values
+        y = data['solar_irradiance'].values
+        self._buffer.extend(np.column_stack([X, y]))
+
+        if incremental and self.is_trained:
+            # Retrain on recent + new samples, growing the existing forest
+            buffered = np.asarray(self._buffer)
+            X, y = buffered[:, :-1], buffered[:, -1]
+            self.model.n_estimators += 20
+            print(f"Growing forest to {self.model.n_estimators} trees...")
+        else:
+            if self.is_trained:
+                # Full rebuild requested: reset the fitted forest
+                self.model = clone(self.model)
+            print("Training Random Forest model...")
+
         # Split data
         X_train, X_test, y_train, y_test = train_test_split(
             X, y, test_size=0.2, random_state=42
         )
-        
+
         # Train model
-        print("Training Random Forest model...")
+        self.model.n_jobs = -1
         self.model.fit(X_train, y_train)
+
+        # Parallel fit helps, but the joblib thread pool hurts single-sample
+        # predict latency
+        self.model.n_jobs = 1
         
         # Evaluate
         y_pred = self.model.predict(X_test)
@@ -108,7 +180,11 @@ class SolarRandomForestModel:
         print(f"R² Score: {r2:.4f}")
         
         self.is_trained = True
-        
+
+        # Export to compiled/optimized runtimes for fast inference
+        self.export_treelite()
+        self.export_onnx()
+
         return {
             'mse': mse,
             'r2_score': r2,
@@ -118,36 +194,122 @@ class SolarRandomForestModel:
             ))
         }
     
+    def export_treelite(self, libpath='models/random_forest_solar.so'):
+        """Compile the trained forest to a treelite shared library"""
+        if treelite is None or treelite_runtime is None:
+            print("treelite not available, skipping compiled forest export")
+            return
+
+        os.makedirs(os.path.dirname(libpath), exist_ok=True)
+
+        try:
+            tl_model = treelite.sklearn.import_model(self.model)
+            tl_model.export_lib(
+                toolchain='gcc',
+                libpath=libpath,
+                params={'parallel_comp': 32},
+                verbose=False
+            )
+            self.predictor = treelite_runtime.Predictor(libpath, verbose=False)
+            print(f"Compiled forest saved to {libpath}")
+        except Exception as e:
+            print(f"Treelite export failed: {e}")
+
+    def export_onnx(self, filepath='models/random_forest_solar.onnx'):
+        """Export the trained forest to ONNX for low-latency inference"""
+        if skl2onnx is None or ort is None:
+            print("skl2onnx/onnxruntime not available, using scikit-learn for inference")
+            return
+
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+        onnx_model = skl2onnx.convert_sklearn(
+            self.model,
+            initial_types=[('input', FloatTensorType([None, len(self.feature_names)]))]
+        )
+
+        with open(filepath, 'wb') as f:
+            f.write(onnx_model.SerializeToString())
+
+        self.session = ort.InferenceSession(
+            filepath, providers=['CPUExecutionProvider']
+        )
+        print(f"ONNX model saved to {filepath}")
+
     def predict(self, weather_data):
         """Predict solar irradiance"""
         if not self.is_trained:
             raise ValueError("Model must be trained before making predictions")
-        
-        # Ensure input is DataFrame with correct features
+
+        # Build a float32 feature array without pandas on the hot path
         if isinstance(weather_data, dict):
-            weather_data = pd.DataFrame([weather_data])
-        
-        # Validate features
-        missing_features = set(self.feature_names) - set(weather_data.columns)
-        if missing_features:
-            raise ValueError(f"Missing features: {missing_features}")
-        
-        # Make prediction
-        predictions = self.model.predict(weather_data[self.feature_names])
-        return predictions
+            missing_features = set(self.feature_names).difference(weather_data)
+            if missing_features:
+                raise ValueError(f"Missing features: {missing_features}")
+            features = np.empty((1, len(self.feature_names)), dtype=np.float32)
+            for name, idx in self._feat_idx.items():
+                features[0, idx] = weather_data[name]
+        elif isinstance(weather_data, np.ndarray):
+            # Pre-assembled feature rows (e.g. from the batching queue)
+            features = np.asarray(weather_data, dtype=np.float32).reshape(
+                -1, len(self.feature_names)
+            )
+        else:
+            missing_features = set(self.feature_names) - set(weather_data.columns)
+            if missing_features:
+                raise ValueError(f"Missing features: {missing_features}")
+            features = np.asarray(
+                weather_data[self.feature_names].values, dtype=np.float32
+            )
+
+        # Prefer compiled/optimized runtimes when available
+        if self.predictor is not None:
+            dmat = treelite_runtime.DMatrix(features)
+            return np.asarray(self.predictor.predict(dmat)).ravel()
+
+        if self.session is not None:
+            predictions = self.session.run(None, {'input': features})[0]
+            return predictions.ravel()
+
+        return self.model.predict(np.ascontiguousarray(features))
     
-    def save_model(self, filepath='models/random_forest_solar.joblib'):
-        """Save trained model"""
+    def save_model(self, filepath='models/random_forest_solar.joblib',
+                   buffer_path='models/rf_sample_buffer.joblib'):
+        """Save trained model and sample buffer"""
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         joblib.dump(self.model, filepath)
+        joblib.dump(np.asarray(self._buffer), buffer_path)
         print(f"Model saved to {filepath}")
     
-    def load_model(self, filepath='models/random_forest_solar.joblib'):
-        """Load trained model"""
+    def load_model(self, filepath='models/random_forest_solar.joblib',
+                   buffer_path='models/rf_sample_buffer.joblib'):
+        """Load trained model and sample buffer"""
         if os.path.exists(filepath):
             self.model = joblib.load(filepath)
+            self.model.n_jobs = 1  # avoid thread-pool cost on single samples
             self.is_trained = True
             print(f"Model loaded from {filepath}")
+
+            if os.path.exists(buffer_path):
+                self._buffer.extend(joblib.load(buffer_path))
+
+            # Reuse an existing compiled forest or build one from the loaded model
+            libpath = 'models/random_forest_solar.so'
+            if treelite_runtime is not None and os.path.exists(libpath):
+                self.predictor = treelite_runtime.Predictor(libpath, verbose=False)
+                print(f"Compiled forest loaded from {libpath}")
+            else:
+                self.export_treelite(libpath)
+
+            # Reuse an existing ONNX export or create one from the loaded model
+            onnx_path = 'models/random_forest_solar.onnx'
+            if ort is not None and os.path.exists(onnx_path):
+                self.session = ort.InferenceSession(
+                    onnx_path, providers=['CPUExecutionProvider']
+                )
+                print(f"ONNX model loaded from {onnx_path}")
+            else:
+                self.export_onnx(onnx_path)
         else:
             print(f"Model file not found: {filepath}")
     